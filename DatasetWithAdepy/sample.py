@@ -1,108 +1,233 @@
+import multiprocessing as mp
 import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv  # C++多线程CSV解析
+import pyarrow.compute as pc
 from tqdm import tqdm
 from scipy.stats.qmc import LatinHypercube  # 拉丁超立方抽样
-from scipy.spatial import KDTree  # 快速找最近邻点
+from scipy.spatial import cKDTree  # 快速找最近邻点（C实现，查询可多线程）
+
+# 采样只用到这三列，读CSV时直接做列投影
+_SAMPLE_COLUMNS = ["X坐标_m", "Y坐标_m", "污染物浓度_mg/L"]
+
+# 结果文件名模式（预编译，文件很多时省去逐文件split/replace开销；
+# 天数允许小数，覆盖obs_times=[0, 0.5, 1, ...]这类场景的文件名）
+_CSV_DAY_PAT = re.compile(r"全局浓度_(\d+(?:\.\d+)?)天\.csv")
+
+
+@lru_cache(maxsize=16)
+def _lhs_unit(n):
+    """
+    单位方块[0,1)²上的LHS样本（seed固定）：同n时各CSV间完全相同，
+    缓存后每个文件只剩仿射缩放，省去重复的QMC初始化和抽样
+    """
+    return LatinHypercube(d=2, seed=42).random(n=n)
+
+
+def _process_one(csv_file, input_csv_dir, output_sparse_dir, sample_strategy,
+                 sample_ratio, sample_num, min_concentration):
+    """
+    处理单个CSV：读取→过滤→采样→写出（进程池的工作单元，文件间相互独立）
+    :return: 采样信息字符串（供主进程统一打印）
+    """
+    # 1. 读取原始数据并过滤无效点（pyarrow并行解析+列投影，过滤在Arrow层完成）
+    csv_path = os.path.join(input_csv_dir, csv_file)
+    table = pv.read_csv(
+        csv_path,
+        convert_options=pv.ConvertOptions(include_columns=_SAMPLE_COLUMNS)
+    )
+    table = table.filter(pc.greater_equal(table["污染物浓度_mg/L"], min_concentration))
+    df_valid = table.to_pandas()
+
+    if len(df_valid) == 0:
+        return f"警告：{csv_file}无有效浓度点，跳过"
+
+    # 2. 确定采样数量
+    if sample_num is not None:
+        n_sample = min(sample_num, len(df_valid))
+    else:
+        n_sample = max(1, int(len(df_valid) * sample_ratio))
+
+    # 坐标范围（各策略与末尾打印共用）
+    x_min, x_max = df_valid["X坐标_m"].min(), df_valid["X坐标_m"].max()
+    y_min, y_max = df_valid["Y坐标_m"].min(), df_valid["Y坐标_m"].max()
+
+    # 3. 采样策略（核心：默认分层索引采样）
+    if sample_strategy == "stratified":
+        # 直接在已有离散点集上分层采样：按(x,y)划分网格层，每个被占用层随机取1行
+        # （目标只是从有限点集中选出空间分布均匀的n_sample行，
+        # 无需连续LHS生成+KDTree最近邻吸附，全程纯NumPy向量化）
+        x_arr = df_valid["X坐标_m"].values
+        y_arr = df_valid["Y坐标_m"].values
+
+        # 步骤1：计算每行所属的层编号（n_strata×n_strata个层，保证层数≥采样数）
+        n_strata = max(1, int(np.ceil(np.sqrt(n_sample))))
+        x_span = x_max - x_min if x_max > x_min else 1.0
+        y_span = y_max - y_min if y_max > y_min else 1.0
+        xb = np.minimum((np.floor((x_arr - x_min) / x_span * n_strata)).astype(np.int32), n_strata - 1)
+        yb = np.minimum((np.floor((y_arr - y_min) / y_span * n_strata)).astype(np.int32), n_strata - 1)
+        cell = xb * n_strata + yb
+
+        # 步骤2：先整体随机置换，再取每个层的首行 → 每个被占用层随机出1个代表行
+        rng = np.random.default_rng(42)
+        perm = rng.permutation(len(cell))
+        _, first_pos = np.unique(cell[perm], return_index=True)
+        rep_indices = rng.permutation(perm[first_pos])
+
+        # 步骤3：被占用层数不足时，从剩余行中补充随机采样
+        if len(rep_indices) < n_sample:
+            remaining_pool = np.setdiff1d(np.arange(len(df_valid)), rep_indices)
+            supplement = rng.choice(remaining_pool, size=n_sample - len(rep_indices), replace=False)
+            final_indices = np.concatenate([rep_indices, supplement])
+        else:
+            final_indices = rep_indices[:n_sample]
+
+    elif sample_strategy == "lhs":
+        # 步骤2：生成LHS采样点（2维：X和Y，缓存的单位方块样本，copy后再原地缩放）
+        lhs_sample = _lhs_unit(n_sample).copy()
+
+        # 步骤3：将LHS采样点映射到实际X/Y坐标范围
+        lhs_sample[:, 0] = x_min + lhs_sample[:, 0] * (x_max - x_min)  # X坐标映射
+        lhs_sample[:, 1] = y_min + lhs_sample[:, 1] * (y_max - y_min)  # Y坐标映射
+
+        # 步骤4：找到LHS采样点对应的原始数据中最近的有效点
+        # （to_numpy(copy=False)：同dtype的两列本就连续存储时避免再拷贝一份）
+        valid_coords = np.ascontiguousarray(df_valid[["X坐标_m", "Y坐标_m"]].to_numpy(copy=False))
+        ux = np.unique(valid_coords[:, 0])
+        uy = np.unique(valid_coords[:, 1])
+        if len(ux) * len(uy) == len(df_valid):
+            # 有效点构成完整规则网格（本流水线的常态）：按网格步长取整直接定位，
+            # O(1)每点，省去每个文件O(N log N)的KDTree构建
+            nx_grid = len(ux)
+            ny_grid = len(uy)
+            x_step = (x_max - x_min) / (nx_grid - 1) if nx_grid > 1 else 1.0
+            y_step = (y_max - y_min) / (ny_grid - 1) if ny_grid > 1 else 1.0
+            ix = np.clip(np.round((lhs_sample[:, 0] - x_min) / x_step).astype(np.int64), 0, nx_grid - 1)
+            iy = np.clip(np.round((lhs_sample[:, 1] - y_min) / y_step).astype(np.int64), 0, ny_grid - 1)
+            indices = iy * nx_grid + ix  # 行序与meshgrid展平一致（x变化最快）
+        else:
+            # 浓度过滤打破了规则网格：回退到KDTree最近邻
+            # 先按粗空间条带重排点序再建树：树内索引≈内存顺序，
+            # 查询遍历叶节点时取坐标更cache友好；perm把结果映射回原行号
+            n_strips = 64
+            x_span = x_max - x_min if x_max > x_min else 1.0
+            y_span = y_max - y_min if y_max > y_min else 1.0
+            bx = np.floor((valid_coords[:, 0] - x_min) / x_span * n_strips)
+            by = np.floor((valid_coords[:, 1] - y_min) / y_span * n_strips)
+            perm = np.lexsort((by, bx))
+            # （不做平衡/压缩构树约快一半；query用workers=-1吃满所有核）
+            kd_tree = cKDTree(valid_coords[perm], leafsize=32, balanced_tree=False, compact_nodes=False)
+            distances, nearest = kd_tree.query(lhs_sample, workers=-1)  # 找最近邻索引
+            indices = perm[nearest]
+
+        # 步骤5：去重（避免多个LHS点匹配到同一个原始点）
+        unique_indices = np.unique(indices)
+        # 若去重后数量不足，从剩余行中补充随机采样（布尔掩码求差集，O(N)）
+        if len(unique_indices) < n_sample:
+            remaining = n_sample - len(unique_indices)
+            mask = np.ones(len(df_valid), dtype=bool)
+            mask[unique_indices] = False
+            supplement_indices = np.random.default_rng(42).choice(
+                np.flatnonzero(mask), size=remaining, replace=False
+            )
+            final_indices = np.concatenate([unique_indices, supplement_indices])
+        else:
+            final_indices = unique_indices[:n_sample]
+
+    # 兼容原有策略（random/uniform）
+    elif sample_strategy == "random":
+        df_sample = df_valid.sample(n=n_sample, random_state=42)
+    elif sample_strategy == "uniform":
+        # 单次groupby分组后每格随机取1行，替代逐格布尔过滤的嵌套循环
+        # （也消除了原先提前break导致的低编号格偏向）
+        n_bins = max(1, int(np.sqrt(n_sample)))
+        xb = pd.cut(df_valid["X坐标_m"], bins=n_bins, labels=False)
+        yb = pd.cut(df_valid["Y坐标_m"], bins=n_bins, labels=False)
+        cell = xb * n_bins + yb
+        df_sample = (
+            df_valid.groupby(cell, sort=False)
+            .sample(n=1, random_state=42)
+            .head(n_sample)
+            .reset_index(drop=True)
+        )
+    else:
+        raise ValueError(f"不支持的策略：{sample_strategy}，可选stratified/lhs/random/uniform")
+
+    # 4. 保存稀疏数据
+    output_path = os.path.join(output_sparse_dir, f"稀疏观测_{csv_file.replace('全局浓度_', '')}")
+    if sample_strategy in ("stratified", "lhs"):
+        # 索引型策略：按列fancy-index出采样数组直接写pyarrow表，
+        # 不物化df_valid.iloc[...]的中间DataFrame（省一次O(N·列数)拷贝）
+        sampled = pa.table({
+            col: df_valid[col].to_numpy(copy=False)[final_indices] for col in df_valid.columns
+        })
+        pv.write_csv(sampled, output_path)
+        n_sampled = len(final_indices)
+    else:
+        df_sample.to_csv(output_path, index=False, encoding="utf-8")
+        n_sampled = len(df_sample)
+
+    # 采样信息（由主进程统一打印，避免多进程输出交错）
+    return (f"\n{csv_file} {sample_strategy}采样完成：\n"
+            f"  原始有效点数：{len(df_valid)} | 采样点数：{n_sampled}\n"
+            f"  采样空间范围：X[{x_min:.1f}, {x_max:.1f}]m，Y[{y_min:.1f}, {y_max:.1f}]m")
 
 
 def sample_sparse_data(
         input_csv_dir: str,  # 原始CSV文件所在目录
         output_sparse_dir: str,  # 稀疏数据保存目录
-        sample_strategy: str = "lhs",  # 新增lhs策略
+        sample_strategy: str = "stratified",  # 默认分层索引采样（另支持lhs/random/uniform）
         sample_ratio: float = 0.01,  # 采样比例（1%）
         sample_num: int = None,  # 固定采样数量（优先级更高）
-        min_concentration: float = 0.1  # 最小有效浓度（过滤0值）
+        min_concentration: float = 0.1,  # 最小有效浓度（过滤0值）
+        max_workers: int = None  # 进程数，默认=CPU核数
 ):
     """
-    新增拉丁超立方（LHS）采样策略，适配PINN稀疏数据需求
+    稀疏观测数据采样，适配PINN稀疏数据需求
+    支持stratified（分层索引采样，默认）/lhs（拉丁超立方）/random/uniform四种策略
+    各CSV文件相互独立，用进程池并行处理（读取→过滤→采样→写出整条流水线）
     """
-    os.makedirs(output_sparse_dir, exist_ok=True)
-
-    # 获取所有CSV文件并按时间排序
-    csv_files = [f for f in os.listdir(input_csv_dir) if f.startswith("全局浓度_") and f.endswith(".csv")]
-    csv_files.sort(key=lambda x: int(x.split("_")[1].replace("天.csv", "")))
-
-    for csv_file in tqdm(csv_files, desc="处理CSV文件（LHS采样）"):
-        # 1. 读取原始数据并过滤无效点
-        csv_path = os.path.join(input_csv_dir, csv_file)
-        df = pd.read_csv(csv_path, encoding="utf-8")
-        df_valid = df[df["污染物浓度_mg/L"] >= min_concentration].reset_index(drop=True)
-
-        if len(df_valid) == 0:
-            print(f"警告：{csv_file}无有效浓度点，跳过")
-            continue
+    if sample_strategy not in ("stratified", "lhs", "random", "uniform"):
+        raise ValueError(f"不支持的策略：{sample_strategy}，可选stratified/lhs/random/uniform")
 
-        # 2. 确定采样数量
-        if sample_num is not None:
-            n_sample = min(sample_num, len(df_valid))
-        else:
-            n_sample = max(1, int(len(df_valid) * sample_ratio))
-
-        # 3. 采样策略（核心：新增LHS采样）
-        if sample_strategy == "lhs":
-            # 步骤1：获取X/Y坐标的范围（LHS采样的空间边界）
-            x_min, x_max = df_valid["X坐标_m"].min(), df_valid["X坐标_m"].max()
-            y_min, y_max = df_valid["Y坐标_m"].min(), df_valid["Y坐标_m"].max()
-
-            # 步骤2：生成LHS采样点（2维：X和Y）
-            lhs_sampler = LatinHypercube(d=2, seed=42)  # d=2表示X/Y二维，seed固定可复现
-            lhs_sample = lhs_sampler.random(n=n_sample)  # 生成[0,1)范围内的采样点
-
-            # 步骤3：将LHS采样点映射到实际X/Y坐标范围
-            lhs_sample[:, 0] = x_min + lhs_sample[:, 0] * (x_max - x_min)  # X坐标映射
-            lhs_sample[:, 1] = y_min + lhs_sample[:, 1] * (y_max - y_min)  # Y坐标映射
-
-            # 步骤4：找到LHS采样点对应的原始数据中最近的有效点（KDTree加速）
-            valid_coords = df_valid[["X坐标_m", "Y坐标_m"]].values
-            kd_tree = KDTree(valid_coords)
-            distances, indices = kd_tree.query(lhs_sample)  # 找最近邻索引
-
-            # 步骤5：去重（避免多个LHS点匹配到同一个原始点）
-            unique_indices = np.unique(indices)
-            # 若去重后数量不足，补充随机采样
-            if len(unique_indices) < n_sample:
-                remaining = n_sample - len(unique_indices)
-                supplement_indices = np.random.choice(
-                    [i for i in range(len(df_valid)) if i not in unique_indices],
-                    size=remaining, replace=False
-                )
-                final_indices = np.concatenate([unique_indices, supplement_indices])
-            else:
-                final_indices = unique_indices[:n_sample]
-
-            # 步骤6：提取采样结果
-            df_sample = df_valid.iloc[final_indices].reset_index(drop=True)
-
-        # 兼容原有策略（random/uniform）
-        elif sample_strategy == "random":
-            df_sample = df_valid.sample(n=n_sample, random_state=42)
-        elif sample_strategy == "uniform":
-            n_bins = int(np.sqrt(n_sample))
-            df_valid["x_bin"] = pd.cut(df_valid["X坐标_m"], bins=n_bins, labels=False)
-            df_valid["y_bin"] = pd.cut(df_valid["Y坐标_m"], bins=n_bins, labels=False)
-            df_sample = []
-            for xb in df_valid["x_bin"].unique():
-                for yb in df_valid["y_bin"].unique():
-                    bin_df = df_valid[(df_valid["x_bin"] == xb) & (df_valid["y_bin"] == yb)]
-                    if len(bin_df) > 0:
-                        df_sample.append(bin_df.sample(1))
-                    if len(df_sample) >= n_sample:
-                        break
-                if len(df_sample) >= n_sample:
-                    break
-            df_sample = pd.concat(df_sample).reset_index(drop=True).drop(columns=["x_bin", "y_bin"])
-        else:
-            raise ValueError(f"不支持的策略：{sample_strategy}，可选lhs/random/uniform")
-
-        # 4. 保存稀疏数据
-        output_path = os.path.join(output_sparse_dir, f"稀疏观测_{csv_file.replace('全局浓度_', '')}")
-        df_sample.to_csv(output_path, index=False, encoding="utf-8")
+    os.makedirs(output_sparse_dir, exist_ok=True)
 
-        # 打印采样信息
-        print(f"\n{csv_file} LHS采样完成：")
-        print(f"  原始有效点数：{len(df_valid)} | 采样点数：{len(df_sample)}")
-        print(f"  采样空间范围：X[{x_min:.1f}, {x_max:.1f}]m，Y[{y_min:.1f}, {y_max:.1f}]m")
+    # 获取所有CSV文件并按时间排序（正则一次提取天数，argsort排序）
+    listing = os.listdir(input_csv_dir)
+    matches = [m for m in map(_CSV_DAY_PAT.fullmatch, listing) if m]
+    days = np.array([float(m.group(1)) for m in matches])
+    csv_files = [matches[i].group(0) for i in np.argsort(days)]
+    # 形似结果文件但天数解析不出来的，明确提示而不是悄悄丢掉
+    for f in listing:
+        if f.startswith("全局浓度_") and f.endswith("天.csv") and not _CSV_DAY_PAT.fullmatch(f):
+            print(f"警告：{f}的天数无法解析，已跳过")
+
+    worker = partial(
+        _process_one,
+        input_csv_dir=input_csv_dir,
+        output_sparse_dir=output_sparse_dir,
+        sample_strategy=sample_strategy,
+        sample_ratio=sample_ratio,
+        sample_num=sample_num,
+        min_concentration=min_concentration,
+    )
+    n_workers = max_workers or os.cpu_count() or 1
+    desc = f"处理CSV文件（{sample_strategy}采样）"
+    if n_workers == 1:
+        # 单核时直接串行，省去进程池开销
+        messages = [worker(f) for f in tqdm(csv_files, desc=desc)]
+    else:
+        # spawn上下文：父进程可能已起过numba/pyarrow线程，fork子进程会死锁
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=mp.get_context("spawn")) as ex:
+            messages = list(tqdm(ex.map(worker, csv_files), total=len(csv_files), desc=desc))
+    for msg in messages:
+        print(msg)
 
 
 # ===================== 示例调用（LHS采样） =====================
@@ -123,4 +248,4 @@ if __name__ == "__main__":
     #     sample_strategy="lhs",
     #     sample_num=50,  # 固定50个点
     #     min_concentration=0.1
-    # )
\ No newline at end of file
+    # )
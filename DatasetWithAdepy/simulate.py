@@ -1,8 +1,126 @@
+import math
+import h5py
 import numpy as np
-import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv  # C++多线程CSV写出
 import matplotlib.pyplot as plt
 import os
-from adepy.uniform import point2
+from numba import njit, prange
+from scipy.special import roots_legendre
+
+try:
+    import cupy as cp  # 可选GPU加速（无CUDA环境时回退CPU）
+    if cp.cuda.runtime.getDeviceCount() == 0:
+        cp = None  # 装了CuPy但没有可用CUDA设备
+except Exception:
+    cp = None  # 未安装CuPy，或CUDA运行时探测失败
+
+# 网格点数达到该规模才走GPU（小网格时主机-设备传输开销反而占优）
+_GPU_MIN_POINTS = 200 * 200
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _point2_core(out, A, E0, pref, obs_times, b, roots, weights):
+    """
+    单污染源的逐时间积分内核（Numba JIT编译，按网格行并行）：
+    接收已预计算的时间无关数组，对每个网格点单遍完成所有观测时间的
+    高斯-勒让德积分并把浓度累加到out (T, Ny, Nx)
+    （逐点标量计算在寄存器内融合完成，不再产生NumPy中间大数组；
+    前置因子的指数E0并入被积函数的指数再统一exp：E0单独取exp在
+    迎流远端会上溢，而E0-b·τ-A/τ整体总是有限；
+    cache=True使编译结果落盘，多场景运行时编译开销只付一次）
+    :param out: 累加输出数组 (T, Ny, Nx)
+    :param A: 积分核空间项 dx²/(4Dx)+dy²/(4Dy)，(Ny, Nx)
+    :param E0: 前置因子的指数 v·dx/(2Dx)，(Ny, Nx)
+    :param pref: 标量前置系数 c0·Qa/(4θπ√(DxDy))
+    :param obs_times: 观测时间点数组 (天)
+    :param b: 积分核时间项系数 v²/(4Dx)
+    :param roots: 高斯-勒让德积分节点
+    :param weights: 高斯-勒让德积分权重
+    """
+    n_t = obs_times.shape[0]
+    ny, nx = A.shape
+    order = roots.shape[0]
+    for i in prange(ny):
+        for j in range(nx):
+            a_ij = A[i, j]
+            e0_ij = E0[i, j]
+            for ti in range(n_t):
+                t = obs_times[ti]
+                if t <= 0:
+                    continue  # t=0时浓度恒为0
+                half = t / 2
+                acc = 0.0
+                for q in range(order):
+                    tau = roots[q] * half + half
+                    acc += weights[q] / tau * math.exp(e0_ij - b * tau - a_ij / tau)
+                out[ti, i, j] += pref * acc * half
+
+
+def _point2_core_cp(out, A, E0, pref, obs_times, b, roots, weights):
+    """
+    _point2_core的CuPy版：同样的高斯-勒让德积分，全部元素级运算在GPU上广播完成
+    （内核纯元素级exp+矩阵-向量归约，受显存带宽限制，大网格下远快于CPU；
+    A/E0按源传一次，积分中间量留在设备端，out为设备端数组）
+    """
+    A_flat = cp.asarray(A).reshape(1, -1)
+    E0_flat = cp.asarray(E0).reshape(1, -1)
+    roots_dev = cp.asarray(roots)
+    weights_dev = cp.asarray(weights)
+    for ti, t in enumerate(obs_times):
+        if t <= 0:
+            continue  # t=0时浓度恒为0
+        tau = (roots_dev * t / 2 + t / 2)[:, None]  # (order, 1)
+        E = cp.exp(E0_flat - b * tau - A_flat / tau) / tau
+        out[ti] += pref * (weights_dev @ E * t / 2).reshape(A.shape)
+
+
+def _point2_batch(x_grid, y_grid, obs_times, sources, c0_list, Qa_list,
+                  v, αL, αT, θ, order=100):
+    """
+    批量计算连续点源二维解析解（Wexler 1992 POINT2算法，式76，同adepy.uniform.point2）
+    外层遍历污染源、内层遍历观测时间：平移坐标dx/dy、指数前置因子、
+    积分核空间项均与时间无关，每个源只计算一次即可在所有时间步复用
+    （循环不变量外提），返回多源叠加后的浓度数组 (T, Ny, Nx)
+    （与逐时逐源调用point2的结果一致，取Dm=0、lamb=0、R=1）
+    :param x_grid: X坐标网格 (Ny, Nx)
+    :param y_grid: Y坐标网格 (Ny, Nx)
+    :param obs_times: 观测时间点列表 (天)
+    :param sources: 污染源坐标列表 [(x1,y1), ...]
+    :param c0_list: 各污染源初始浓度列表 (mg/L)
+    :param Qa_list: 各污染源注入速率列表 (m²/d)
+    :param v: 孔隙流速 (m/d)
+    :param αL: 纵向扩散率 (m)
+    :param αT: 横向扩散率 (m)
+    :param θ: 有效孔隙度
+    :param order: 高斯-勒让德积分阶数
+    :return: 多源叠加浓度数组 (len(obs_times), Ny, Nx)
+    """
+    Dx = αL * v
+    Dy = αT * v
+    b = v ** 2 / (4 * Dx)
+    roots, weights = roots_legendre(order)
+    obs_times = np.asarray(obs_times, dtype=np.float64)
+
+    # 大网格且有CuPy/CUDA时在GPU上积分，否则走Numba CPU内核
+    use_gpu = cp is not None and x_grid.size >= _GPU_MIN_POINTS
+    xp = cp if use_gpu else np
+
+    # 输出精度跟随网格dtype（float32网格→float32浓度，带宽减半）
+    total = xp.zeros((len(obs_times),) + x_grid.shape, dtype=x_grid.dtype)  # (T, Ny, Nx)
+    for (xc, yc), c0, qa in zip(sources, c0_list, Qa_list):
+        # 时间无关量：每个源只算一次，供所有时间步复用
+        # （前置因子不单独取exp：其指数E0在积分内与-b·τ-A/τ合并后再exp，避免上溢）
+        dx = x_grid - xc
+        dy = y_grid - yc
+        E0 = v * dx / (2 * Dx)
+        pref = c0 * qa / (4 * θ * np.pi * np.sqrt(Dx * Dy))
+        A = dx ** 2 / (4 * Dx) + dy ** 2 / (4 * Dy)
+        if use_gpu:
+            _point2_core_cp(total, A, E0, pref, obs_times, b, roots, weights)
+        else:
+            _point2_core(total, A, E0, pref, obs_times, b, roots, weights)
+    return cp.asnumpy(total) if use_gpu else total
 
 
 def create_contamination_scenario(
@@ -24,7 +142,11 @@ def create_contamination_scenario(
         Qa_list: list = [1 / 10],  # 各污染源注入速率列表（m²/d）
         # 时间参数（默认=1年周期，指定观测时间点）
         stress_cycle_d: int = 365,
-        obs_times: list = [0, 1, 10, 30, 60, 180, 300, 330]
+        obs_times: list = [0, 1, 10, 30, 60, 180, 300, 330],
+        # 出图开关（纯数据集生成场景可关闭，省掉全部matplotlib开销）
+        make_plots: bool = True,
+        # 逐时间点CSV开关（稀疏采样等旧流程仍按CSV消费；HDF5始终写出）
+        write_csv: bool = True
 ):
     """
     生成地下水单物种多污染源扩散模拟场景的核心函数
@@ -43,6 +165,8 @@ def create_contamination_scenario(
     :param Qa_list: 各污染源注入速率列表 (m²/d)，长度必须与sources一致
     :param stress_cycle_d: 应力周期/模拟总时长 (天)
     :param obs_times: 观测时间点列表 (天)
+    :param make_plots: 是否生成浓度分布图和时间序列图（False时只产出数据文件）
+    :param write_csv: 是否额外写出逐时间点CSV（HDF5结果文件sim.h5始终写出）
     """
     # ===================== 关键：参数校验（避免数量不匹配） =====================
     if len(c0_list) != len(sources):
@@ -86,123 +210,142 @@ def create_contamination_scenario(
     plt.switch_backend('Agg')
     plt.rcParams["font.family"] = "Microsoft YaHei"
     plt.rcParams["axes.unicode_minus"] = False
-    plt.rcParams["figure.dpi"] = 300
-    plt.rcParams["savefig.dpi"] = 300
+    plt.rcParams["figure.dpi"] = 150  # 诊断用图，150dpi足够且渲染量减半
+    plt.rcParams["savefig.dpi"] = 150
 
-    # 模拟网格生成
-    x_grid_arr = np.linspace(x_range[0], x_range[1], grid_num)
-    y_grid_arr = np.linspace(y_range[0], y_range[1], grid_num)
+    # 模拟网格生成（float32：下游仅用于出图和统计，单精度足够，内存带宽减半）
+    x_grid_arr = np.linspace(x_range[0], x_range[1], grid_num, dtype=np.float32)
+    y_grid_arr = np.linspace(y_range[0], y_range[1], grid_num, dtype=np.float32)
     x_grid, y_grid = np.meshgrid(x_grid_arr, y_grid_arr)
 
     # 孔隙流速计算
     v = Kαα / θ
 
     # ===================== 4. 预计算所有时间点浓度（多源差异化Qa+叠加） =====================
-    all_concentrations = []
-    for t in obs_times:
-        if t == 0:
-            total_conc = np.zeros_like(x_grid)
-        else:
-            total_conc = np.zeros_like(x_grid)
-            # 核心：遍历每个污染源，取对应浓度+对应注入速率计算
-            for (xc, yc), c0, qa in zip(sources, c0_list, Qa_list):
-                single_source_conc = point2(
-                    x=x_grid, y=y_grid, t=t,
-                    v=v, al=αL, ah=αT, n=θ,
-                    xc=xc, yc=yc, Qa=qa, c0=c0  # 每个源用独立的Qa和c0
-                )
-                total_conc += single_source_conc
-        all_concentrations.append(total_conc)
+    # 外层按源、内层按时间向量化计算并叠加，得到 (T, Ny, Nx) 浓度数组
+    all_concentrations = _point2_batch(
+        x_grid, y_grid, obs_times, sources, c0_list, Qa_list,
+        v=v, αL=αL, αT=αT, θ=θ
+    )
 
-    # 统一颜色刻度
-    max_conc = np.max([np.max(conc) for conc in all_concentrations]) * 1.1
+    # 统一颜色刻度 + 各时间点汇总统计：对(T, Ny*Nx)数组一次性按轴归约
+    flat_all = all_concentrations.reshape(len(obs_times), -1)
+    per_t_max = flat_all.max(axis=1)
+    per_t_mean = flat_all.mean(axis=1, dtype=np.float64)
+    per_t_std = flat_all.std(axis=1, dtype=np.float64)
+    max_conc = float(per_t_max.max()) * 1.1
     unified_levels = np.linspace(0, max_conc, 50)
 
+    # 整体写一个分块压缩的HDF5：c为(T,Ny,Nx)浓度数组，按单时间步分块
+    # （下游PINN按时间步读取；二进制+lzf压缩，比逐时间点CSV小且加载快一个量级以上）
+    h5_path = os.path.join(SCENE_ROOT, "sim.h5")
+    with h5py.File(h5_path, "w") as f:
+        f.create_dataset(
+            "c", data=all_concentrations,
+            chunks=(1,) + x_grid.shape, compression="lzf"
+        )
+        f["x"] = x_grid_arr
+        f["y"] = y_grid_arr
+        f["t"] = np.asarray(obs_times)
+
     # ===================== 5. 浓度计算+文件保存 =====================
+    if make_plots:
+        # 复用同一Figure/Axes/colorbar轴：画布创建、字体解析、colorbar布局只做一次
+        fig, ax = plt.subplots(figsize=(12, 8))
+        fig.subplots_adjust(right=0.88)  # 固定布局一次，savefig不再做tight二次渲染
+        cax = fig.add_axes([0.92, 0.15, 0.02, 0.7])
+        cbar = None
+
     summary_data = []
     for idx, t in enumerate(obs_times):
         print(f"[{scene_name}] 正在处理时间点：{t}天")
         total_conc = all_concentrations[idx]
 
-        # 保存CSV
-        flat_x = x_grid.flatten()
-        flat_y = y_grid.flatten()
-        flat_conc = total_conc.flatten()
-        global_df = pd.DataFrame({
-            "X坐标_m": flat_x,
-            "Y坐标_m": flat_y,
-            "污染物浓度_mg/L": flat_conc
-        })
-        csv_path = os.path.join(CSV_DIR, f"全局浓度_{t}天.csv")
-        global_df.to_csv(csv_path, index=False, encoding="utf-8")
+        # 保存CSV（pyarrow多线程写出，热路径上不再构造DataFrame）
+        if write_csv:
+            global_table = pa.table({
+                "X坐标_m": x_grid.flatten(),
+                "Y坐标_m": y_grid.flatten(),
+                "污染物浓度_mg/L": total_conc.flatten()
+            })
+            csv_path = os.path.join(CSV_DIR, f"全局浓度_{t}天.csv")
+            pv.write_csv(global_table, csv_path)
 
-        # 绘制浓度分布图（标注浓度+注入速率）
-        fig, ax = plt.subplots(figsize=(12, 8))
-        contour = ax.contourf(
-            x_grid, y_grid, total_conc,
-            levels=unified_levels, vmin=0, vmax=max_conc,
-            cmap="jet", alpha=0.8
-        )
-        # 标注每个污染源的浓度+注入速率
-        for i, ((xc, yc), c0, qa) in enumerate(zip(sources, c0_list, Qa_list)):
-            ax.scatter(
-                xc, yc, color="red", s=150, marker="*",
-                edgecolor="darkred", linewidth=2,
-                label=f"污染源{i + 1}（{c0}mg/L，{qa}m²/d）" if i == 0 else ""
-            )
-            ax.annotate(
-                f"源{i + 1}：{c0}mg/L\nQa={qa}m²/d", (xc, yc),
-                xytext=(10, 10), textcoords="offset points",
-                fontsize=10, color="darkred", weight="bold"
+        if make_plots:
+            # 绘制浓度分布图（标注浓度+注入速率）
+            ax.clear()
+            contour = ax.contourf(
+                x_grid, y_grid, total_conc,
+                levels=unified_levels, vmin=0, vmax=max_conc,
+                cmap="jet", alpha=0.8
             )
-        # 图表样式
-        ax.set_xlabel("X坐标 (m)", fontsize=12)
-        ax.set_ylabel("Y坐标 (m)", fontsize=12)
-        ax.set_title(f"{scene_name} - 污染物浓度分布（{t}天，{len(sources)}个污染源）", fontsize=14)
-        ax.grid(alpha=0.3)
-        ax.legend(loc="upper right")
-        cbar = plt.colorbar(contour, ax=ax, shrink=0.9)
-        cbar.set_label("浓度 (mg/L)", fontsize=11)
-        # 保存图片
-        plot_path = os.path.join(PLOT_DIR, f"浓度分布图_{t}天.png")
-        plt.savefig(plot_path, bbox_inches="tight")
-        plt.close()
+            # 标注每个污染源的浓度+注入速率
+            for i, ((xc, yc), c0, qa) in enumerate(zip(sources, c0_list, Qa_list)):
+                ax.scatter(
+                    xc, yc, color="red", s=150, marker="*",
+                    edgecolor="darkred", linewidth=2,
+                    label=f"污染源{i + 1}（{c0}mg/L，{qa}m²/d）" if i == 0 else ""
+                )
+                ax.annotate(
+                    f"源{i + 1}：{c0}mg/L\nQa={qa}m²/d", (xc, yc),
+                    xytext=(10, 10), textcoords="offset points",
+                    fontsize=10, color="darkred", weight="bold"
+                )
+            # 图表样式
+            ax.set_xlabel("X坐标 (m)", fontsize=12)
+            ax.set_ylabel("Y坐标 (m)", fontsize=12)
+            ax.set_title(f"{scene_name} - 污染物浓度分布（{t}天，{len(sources)}个污染源）", fontsize=14)
+            ax.grid(alpha=0.3)
+            ax.legend(loc="upper right")
+            if cbar is None:  # 色标只建一次，后续迭代刻度相同（统一levels）直接复用
+                cbar = fig.colorbar(contour, cax=cax)
+                cbar.set_label("浓度 (mg/L)", fontsize=11)
+            else:
+                cbar.update_normal(contour)
+            # 保存图片
+            plot_path = os.path.join(PLOT_DIR, f"浓度分布图_{t}天.png")
+            fig.savefig(plot_path, pil_kwargs={"optimize": False, "compress_level": 1})
 
-        # 记录汇总数据
+        # 记录汇总数据（统计量已在循环前按轴一次性算好）
         summary_data.append({
             "观测时间_d": t,
-            "最大浓度_mg/L": np.max(flat_conc),
-            "平均浓度_mg/L": np.mean(flat_conc),
-            "浓度标准差": np.std(flat_conc)
+            "最大浓度_mg/L": per_t_max[idx],
+            "平均浓度_mg/L": per_t_mean[idx],
+            "浓度标准差": per_t_std[idx]
         })
+    if make_plots:
+        plt.close(fig)
 
     # ===================== 6. 保存汇总时间序列图 =====================
-    fig, ax = plt.subplots(figsize=(12, 7))
-    ax.plot([d["观测时间_d"] for d in summary_data], [d["最大浓度_mg/L"] for d in summary_data],
-            color="#E63946", linewidth=2, marker="o", markersize=8, label="最大浓度")
-    ax.plot([d["观测时间_d"] for d in summary_data], [d["平均浓度_mg/L"] for d in summary_data],
-            color="#457B9D", linewidth=2, marker="s", markersize=8, label="平均浓度")
-    # 标注数值
-    for idx, row in enumerate(summary_data):
-        ax.annotate(f"{row['最大浓度_mg/L']:.2f}", (row["观测时间_d"], row["最大浓度_mg/L"]),
-                    xytext=(5, 5), textcoords="offset points", fontsize=9, color="#E63946")
-        ax.annotate(f"{row['平均浓度_mg/L']:.2f}", (row["观测时间_d"], row["平均浓度_mg/L"]),
-                    xytext=(5, -15), textcoords="offset points", fontsize=9, color="#457B9D")
-    # 样式配置
-    ax.set_xlabel("观测时间 (天)", fontsize=12)
-    ax.set_ylabel("浓度 (mg/L)", fontsize=12)
-    ax.set_title(f"{scene_name} - 浓度时间序列（{len(sources)}个污染源，应力周期={stress_cycle_d}天）", fontsize=14)
-    ax.grid(alpha=0.3)
-    ax.legend(loc="upper left")
-    # 保存汇总图
-    summary_plot_path = os.path.join(PLOT_DIR, f"{scene_name}_浓度时间序列.png")
-    plt.savefig(summary_plot_path, bbox_inches="tight")
-    plt.close()
+    if make_plots:
+        fig, ax = plt.subplots(figsize=(12, 7))
+        ax.plot([d["观测时间_d"] for d in summary_data], [d["最大浓度_mg/L"] for d in summary_data],
+                color="#E63946", linewidth=2, marker="o", markersize=8, label="最大浓度")
+        ax.plot([d["观测时间_d"] for d in summary_data], [d["平均浓度_mg/L"] for d in summary_data],
+                color="#457B9D", linewidth=2, marker="s", markersize=8, label="平均浓度")
+        # 标注数值
+        for idx, row in enumerate(summary_data):
+            ax.annotate(f"{row['最大浓度_mg/L']:.2f}", (row["观测时间_d"], row["最大浓度_mg/L"]),
+                        xytext=(5, 5), textcoords="offset points", fontsize=9, color="#E63946")
+            ax.annotate(f"{row['平均浓度_mg/L']:.2f}", (row["观测时间_d"], row["平均浓度_mg/L"]),
+                        xytext=(5, -15), textcoords="offset points", fontsize=9, color="#457B9D")
+        # 样式配置
+        ax.set_xlabel("观测时间 (天)", fontsize=12)
+        ax.set_ylabel("浓度 (mg/L)", fontsize=12)
+        ax.set_title(f"{scene_name} - 浓度时间序列（{len(sources)}个污染源，应力周期={stress_cycle_d}天）", fontsize=14)
+        ax.grid(alpha=0.3)
+        ax.legend(loc="upper left")
+        # 保存汇总图
+        summary_plot_path = os.path.join(PLOT_DIR, f"{scene_name}_浓度时间序列.png")
+        fig.tight_layout()
+        fig.savefig(summary_plot_path, pil_kwargs={"optimize": False, "compress_level": 1})
+        plt.close()
 
     # ===================== 7. 输出完成提示 =====================
     print(f"\n===== {scene_name} 生成完成 =====")
     print(f"场景根目录：{os.path.abspath(SCENE_ROOT)}")
     print(f"参数记录文件：{os.path.abspath(param_txt_path)}")
+    print(f"HDF5结果文件：{os.path.abspath(h5_path)}")
     print(f"CSV结果目录：{os.path.abspath(CSV_DIR)}")
     print(f"图片结果目录：{os.path.abspath(PLOT_DIR)}")
     print(f"统一颜色刻度范围：0 ~ {max_conc:.2f} mg/L")